@@ -1,29 +1,40 @@
 import os
-import requests
+import re
+import threading
+import time
+import uuid
+import json
+import multiprocessing
 import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from numba import njit
 from datetime import datetime, timedelta
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 import yfinance as yf
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
-from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_RIGHT
 from reportlab.lib.units import inch
 from io import BytesIO
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_file, abort, url_for
 import requests_cache
+import charts
+from charts import CHART_COLUMNS, render_technical_chart
 
 # --- Flask App Initialization & Caching Setup ---
 app = Flask(__name__)
-OUTPUT_FOLDER = 'outputs'
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-session = requests_cache.CachedSession('yfinance.cache', expire_after=timedelta(hours=1), backend='sqlite')
+# Generated PDFs live in the instance folder as <token>.pdf until they expire, so any gunicorn worker can serve the download
+REPORT_TTL_SECONDS = 600
+REPORT_FOLDER = os.path.join(app.instance_path, 'reports')
+os.makedirs(REPORT_FOLDER, mode=0o700, exist_ok=True)
+_last_prune = 0.0
+# Filesystem backend: one pickled file per response, so cache hits are a plain file read with no SQLite query parsing
+session = requests_cache.CachedSession('yfinance.cache', expire_after=timedelta(hours=1), backend='filesystem', serializer='pickle')
 session.headers['User-Agent'] = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:89.0) Gecko/20100101 Firefox/89.0'
 
 # --- Data for Front-End & Peer Analysis ---
@@ -33,6 +44,8 @@ SECTOR_STOCK_MAPPING = {
     "Energy": [{"name": "Reliance Industries", "ticker": "RELIANCE.NS"}, {"name": "ONGC", "ticker": "ONGC.NS"}, {"name": "NTPC", "ticker": "NTPC.NS"}, {"name": "Power Grid", "ticker": "POWERGRID.NS"}, {"name": "Adani Power", "ticker": "ADANIPOWER.NS"}, {"name": "Tata Power", "ticker": "TATAPOWER.NS"}],
     "Automobiles": [{"name": "Tata Motors", "ticker": "TATAMOTORS.NS"}, {"name": "Mahindra and Mahindra", "ticker": "M&M.NS"}, {"name": "Maruti Suzuki", "ticker": "MARUTI.NS"}, {"name": "Eicher Motors", "ticker": "EICHERMOT.NS"}, {"name": "Bajaj Auto", "ticker": "BAJAJ-AUTO.NS"}]
 }
+# Serialized once at import; sort_keys matches the key order jsonify produced
+_STOCKS_JSON = json.dumps(SECTOR_STOCK_MAPPING, sort_keys=True).encode()
 PEER_MAPPING = {
     "HDFCBANK.NS": ["ICICIBANK.NS", "SBIN.NS", "AXISBANK.NS", "KOTAKBANK.NS"], 
     "ICICIBANK.NS": ["HDFCBANK.NS", "AXISBANK.NS", "KOTAKBANK.NS", "SBIN.NS"], 
@@ -43,22 +56,22 @@ PEER_MAPPING = {
     "TATAMOTORS.NS": ["MARUTI.NS", "M&M.NS", "EICHERMOT.NS"]
 }
 
-# --- CRITICAL FIX #1: Added this helper function to prevent the "Boolean Logic" error ---
-def get_scalar(value):
-    if isinstance(value, pd.Series): return value.iloc[0] if not value.empty else None
-    return value
+def last_value(df, column):
+    # O(1) read of the column's last element straight from its ndarray; ravel covers yfinance's MultiIndex 'Close' frames
+    if column not in df: return None
+    value = float(df[column].to_numpy().ravel()[-1])
+    return None if np.isnan(value) else value
 
 # --- Data Fetching and Analysis Functions ---
-def fetch_company_info(symbol):
+def fetch_company_info(ticker):
+    symbol = ticker.ticker
     try:
-        ticker = yf.Ticker(symbol, session=session)
         info = ticker.info
         if not info or info.get('marketCap') is None:
             raise ValueError("Incomplete data from source")
         
         data = {
             'info': info, 
-            'logo_image': fetch_logo(info),
             'financials': ticker.financials, 
             'balance_sheet': ticker.balance_sheet, 
             'quarterly_financials': ticker.quarterly_financials,
@@ -72,42 +85,98 @@ def fetch_company_info(symbol):
         print(f"Critical error fetching fundamental data for {symbol}: {e}")
         raise ValueError(f"Could not retrieve critical data for {symbol}.")
 
-def fetch_logo(info):
-    try:
-        if 'logo_url' in info and info['logo_url']:
-            response = requests.get(info['logo_url'], stream=True, timeout=5)
-            if response.status_code == 200: return ImageReader(BytesIO(response.content))
-    except Exception: return None
-    return None
-
-def fetch_price(symbol, period="3y"):
+def fetch_price(symbol, period="2y"): # Smallest fixed period covering the 200-day SMA warm-up plus a year of chart
     df = yf.download(symbol, period=period, interval="1d", progress=False, auto_adjust=True, session=session)
     return df if not df.empty else None
 
-def compute_technical_indicators(df):
+# --- Numba kernels for the indicator pipeline: single O(n) passes over the Close array, GIL released so threaded requests overlap ---
+# Arrays are float32 to halve memory traffic; running sums and EMA state stay float64 scalars so accuracy isn't lost
+@njit(cache=True, nogil=True)
+def _trend_bands(close, fast_window, slow_window, bb_window):
+    # Fused pass: both SMAs as running sums, Bollinger mid/std as a sliding Welford window. NaNs are skipped and void their windows.
+    n = close.shape[0]
+    sma_fast = np.full(n, np.nan, np.float32); sma_slow = np.full(n, np.nan, np.float32); bb_mid = np.full(n, np.nan, np.float32); bb_std = np.full(n, np.nan, np.float32)
+    fast_sum = 0.0; fast_count = 0; slow_sum = 0.0; slow_count = 0; bb_mean = 0.0; bb_m2 = 0.0; bb_count = 0
+    for i in range(n):
+        x = close[i]
+        if not np.isnan(x):
+            fast_sum += x; fast_count += 1; slow_sum += x; slow_count += 1
+            bb_count += 1; d = x - bb_mean; bb_mean += d / bb_count; bb_m2 += d * (x - bb_mean)
+        if i >= fast_window:
+            y = close[i - fast_window]
+            if not np.isnan(y): fast_sum -= y; fast_count -= 1
+        if i >= slow_window:
+            y = close[i - slow_window]
+            if not np.isnan(y): slow_sum -= y; slow_count -= 1
+        if i >= bb_window:
+            y = close[i - bb_window]
+            if not np.isnan(y):
+                bb_count -= 1
+                if bb_count == 0: bb_mean = 0.0; bb_m2 = 0.0
+                else: d = y - bb_mean; bb_mean -= d / bb_count; bb_m2 -= d * (y - bb_mean)
+        if fast_count == fast_window: sma_fast[i] = fast_sum / fast_window
+        if slow_count == slow_window: sma_slow[i] = slow_sum / slow_window
+        if bb_count == bb_window: bb_mid[i] = bb_mean; bb_std[i] = np.sqrt(max(bb_m2, 0.0) / (bb_window - 1))
+    return sma_fast, sma_slow, bb_mid, bb_std
+
+@njit(cache=True, nogil=True)
+def _macd(close, fast_span, slow_span, signal_span):
+    # Fused MACD: fast/slow/signal EMAs (pandas ewm adjust=False) advance together in one pass; NaN inputs carry the previous value forward
+    n = close.shape[0]; line = np.full(n, np.nan, np.float32); signal = np.full(n, np.nan, np.float32); hist = np.full(n, np.nan, np.float32)
+    fast_alpha = 2.0 / (fast_span + 1.0); slow_alpha = 2.0 / (slow_span + 1.0); signal_alpha = 2.0 / (signal_span + 1.0)
+    fast = np.nan; slow = np.nan; sig = np.nan
+    for i in range(n):
+        x = close[i]
+        if np.isnan(fast): fast = x; slow = x
+        elif not np.isnan(x): fast += fast_alpha * (x - fast); slow += slow_alpha * (x - slow)
+        value = fast - slow
+        if np.isnan(sig): sig = value
+        elif not np.isnan(value): sig += signal_alpha * (value - sig)
+        line[i] = value; signal[i] = sig; hist[i] = value - sig
+    return line, signal, hist
+
+@njit(cache=True, nogil=True)
+def _rsi(gain, loss, window):
+    # Wilder-smoothed RSI: seeded with the simple mean of the first window moves, then avg = (avg*(window-1) + x) / window
+    n = gain.shape[0]; out = np.full(n, np.nan, np.float32)
+    if n <= window: return out
+    avg_gain = 0.0; avg_loss = 0.0
+    for i in range(1, window + 1): avg_gain += gain[i]; avg_loss += loss[i]
+    avg_gain /= window; avg_loss /= window
+    for i in range(window, n):
+        if i > window: avg_gain = (avg_gain * (window - 1) + gain[i]) / window; avg_loss = (avg_loss * (window - 1) + loss[i]) / window
+        out[i] = 100 - (100 / (1 + avg_gain / (avg_loss if avg_loss != 0 else 1e-9)))
+    return out
+
+@lru_cache(maxsize=128)
+def _compute_from_array(symbol, last_ts_ns, close_bytes):
+    # Keyed on (symbol, last bar); the raw close bytes are part of the key so a revised intraday bar is never served stale
+    close = np.frombuffer(close_bytes, dtype=np.float32)
+    sma_50, sma_200, bb_mid, bb_std = _trend_bands(close, 50, 200, 20)
+    macd_line, macd_signal, macd_hist = _macd(close, 12, 26, 9)
+    delta = np.diff(close, prepend=close[0]); gain = np.fmax(delta, 0.0); loss = np.fmax(-delta, 0.0) # fmax maps NaN moves to 0, no boolean masks
+    indicators = {'sma_50': sma_50, 'sma_200': sma_200, 'bb_mid': bb_mid, 'bb_std': bb_std, 'bb_upper': bb_mid + 2 * bb_std, 'bb_lower': bb_mid - 2 * bb_std,
+                  'macd_line': macd_line, 'macd_signal': macd_signal, 'macd_hist': macd_hist, 'rsi': _rsi(gain, loss, 14)}
+    for values in indicators.values(): values.setflags(write=False) # Shared between requests, so never mutate in place
+    return indicators
+
+def _warm_up_kernels():
+    # Compile (or load from the on-disk cache) at import so the first /generate request doesn't pay the JIT cost.
+    # Goes through the uncached request path so the kernels specialize on the same read-only frombuffer arrays.
+    _compute_from_array.__wrapped__(None, 0, np.zeros(300, dtype=np.float32).tobytes()) # Long enough to fill the 200-day window
+
+_warm_up_kernels()
+
+def compute_technical_indicators(df, symbol=None):
     if df is None or df.empty: return None
-    df['sma_50'] = df['Close'].rolling(window=50).mean()
-    df['sma_200'] = df['Close'].rolling(window=200).mean()
-    df['bb_mid'] = df['Close'].rolling(window=20).mean()
-    df['bb_std'] = df['Close'].rolling(window=20).std()
-    df['bb_upper'] = df['bb_mid'] + 2 * df['bb_std']
-    df['bb_lower'] = df['bb_mid'] - 2 * df['bb_std']
-    df['ema_12'] = df['Close'].ewm(span=12, adjust=False).mean()
-    df['ema_26'] = df['Close'].ewm(span=26, adjust=False).mean()
-    df['macd_line'] = df['ema_12'] - df['ema_26']
-    df['macd_signal'] = df['macd_line'].ewm(span=9, adjust=False).mean()
-    df['macd_hist'] = df['macd_line'] - df['macd_signal']
-    delta = df['Close'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-    rs = gain / loss.replace(0, 1e-9)
-    df['rsi'] = 100 - (100 / (1 + rs))
+    close = df['Close'].to_numpy(dtype=np.float32).ravel() # Prices carry ~5 significant digits, well within float32
+    indicators = _compute_from_array(symbol, pd.Timestamp(df.index[-1]).value, close.tobytes())
+    for column, values in indicators.items(): df[column] = values
     return df
 
-def fetch_news_yfinance(symbol, limit=5):
+def fetch_news_yfinance(ticker, limit=5):
     news = []
     try:
-        ticker = yf.Ticker(symbol, session=session)
         news_data = ticker.news
         if news_data:
             for item in news_data[:limit]:
@@ -116,60 +185,105 @@ def fetch_news_yfinance(symbol, limit=5):
         print(f"Error fetching news from yfinance: {e}")
     return news
 
+def _fetch_peer(peer_symbol):
+    try:
+        info = yf.Ticker(peer_symbol, session=session).info
+        return {'name': info.get('shortName', peer_symbol), 'pe': info.get('trailingPE'), 'roe': info.get('returnOnEquity')}
+    except Exception: return None
+
 def get_peer_comparison(peers):
-    peer_details = []
-    for peer_symbol in peers:
-        try:
-            info = yf.Ticker(peer_symbol, session=session).info
-            peer_details.append({'name': info.get('shortName', peer_symbol), 'pe': info.get('trailingPE'), 'roe': info.get('returnOnEquity')})
-        except Exception: continue
+    if not peers: return pd.DataFrame()
+    # Peer .info lookups are independent HTTP round-trips, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=min(len(peers), 8)) as executor:
+        peer_details = [detail for detail in executor.map(_fetch_peer, peers) if detail]
     return pd.DataFrame(peer_details)
 
-def generate_key_highlights(fundamentals, tech_analysis):
+def generate_key_highlights(fundamentals, tech_flags):
     highlights = []
-    rec = generate_recommendation(fundamentals, tech_analysis)
+    rec = generate_recommendation(fundamentals, tech_flags)
     highlights.append(f"<b>Overall Recommendation:</b> Based on a composite analysis, the current recommendation is to <b>{rec}</b>.")
     pe = fundamentals.get('Trailing PE')
     if pe is not None: highlights.append(f"<b>Valuation:</b> The stock's P/E ratio of {pe:.2f} suggests a {'fair' if 15 <= pe <= 30 else 'potentially high' if pe > 30 else 'potentially low'} valuation.")
-    if any("Bullish" in s for s in tech_analysis): highlights.append("<b>Technical Trend:</b> The stock is showing bullish long-term trend signals.")
-    elif any("Bearish" in s for s in tech_analysis): highlights.append("<b>Technical Trend:</b> The stock is showing bearish long-term trend signals.")
+    if tech_flags['bullish_sma']: highlights.append("<b>Technical Trend:</b> The stock is showing bullish long-term trend signals.")
+    elif tech_flags['bearish_sma']: highlights.append("<b>Technical Trend:</b> The stock is showing bearish long-term trend signals.")
     roe = fundamentals.get('ROE')
     if roe is not None: highlights.append(f"<b>Company Performance:</b> With a Return on Equity of {roe*100:.2f}%, the company shows {'strong' if roe > 0.15 else 'moderate'} profitability.")
     return highlights
 
-def generate_recommendation(fundamentals, tech_analysis):
+def generate_recommendation(fundamentals, tech_flags):
     score = 0; roe = fundamentals.get('ROE'); pe = fundamentals.get('Trailing PE'); de = fundamentals.get('Debt to Equity')
     if roe is not None and roe > 0.15: score += 1
     if pe is not None and pe < 30: score += 1
     if de is not None and de < 150: score += 1
-    if any("Bullish" in s for s in tech_analysis): score += 1
-    if any("Overbought" in s for s in tech_analysis): score -= 1
+    if tech_flags['bullish_sma']: score += 1
+    if tech_flags['overbought']: score -= 1
     if score >= 3: return "BUY"
     if score >= 1: return "HOLD"
     return "SELL"
 
 def interpret_technical(df):
-    analysis = []
-    if df is None or df.empty: return ["Technical data not available."]
-    latest = df.iloc[-1]
-    
-    # --- CRITICAL FIX #1 (continued): Using the get_scalar helper on all values before comparison ---
-    sma_50 = get_scalar(latest.get('sma_50')); sma_200 = get_scalar(latest.get('sma_200')); close_price = get_scalar(latest.get('Close'))
-    bb_upper = get_scalar(latest.get('bb_upper')); macd_line = get_scalar(latest.get('macd_line')); macd_signal = get_scalar(latest.get('macd_signal')); rsi = get_scalar(latest.get('rsi'))
+    # Returns the report lines plus boolean signal flags, so scoring doesn't have to substring-search the text
+    analysis = []; flags = dict.fromkeys(['bullish_sma', 'bearish_sma', 'high_volatility', 'positive_macd', 'overbought', 'oversold'], False)
+    if df is None or df.empty: return ["Technical data not available."], flags
+    sma_50 = last_value(df, 'sma_50'); sma_200 = last_value(df, 'sma_200'); close_price = last_value(df, 'Close')
+    bb_upper = last_value(df, 'bb_upper'); macd_line = last_value(df, 'macd_line'); macd_signal = last_value(df, 'macd_signal'); rsi = last_value(df, 'rsi')
 
     if sma_50 is not None and sma_200 is not None:
+        flags['bullish_sma'] = bool(sma_50 > sma_200); flags['bearish_sma'] = not flags['bullish_sma']
         analysis.append("<b>Trend (SMA):</b> " + ("Bullish (Golden Cross)" if sma_50 > sma_200 else "Bearish (Death Cross)"))
     if bb_upper is not None and close_price is not None:
+        flags['high_volatility'] = bool(close_price > bb_upper)
         analysis.append("<b>Volatility (Bollinger):</b> " + ("High (Price above upper band)" if close_price > bb_upper else "Normal"))
     if macd_line is not None and macd_signal is not None:
+        flags['positive_macd'] = bool(macd_line > macd_signal)
         analysis.append("<b>Momentum (MACD):</b> " + ("Positive (MACD above signal)" if macd_line > macd_signal else "Negative (MACD below signal)"))
     if rsi is not None:
+        flags['overbought'] = bool(rsi > 70); flags['oversold'] = bool(rsi < 30)
         analysis.append(f"<b>Strength (RSI):</b> {('Overbought' if rsi > 70 else 'Oversold' if rsi < 30 else 'Neutral')} at {rsi:.2f}")
-    return analysis
+    return analysis, flags
+
+# --- Chart rendering, run in a worker process so it overlaps the rest of the report build ---
+CHART_TIMEOUT_SECONDS = 30
+_chart_pool = None; _chart_pool_lock = threading.Lock()
+
+def chart_pool_context():
+    # forkserver avoids forking a process whose fetch threads are mid-request; it isn't available on Windows, so fall back to spawn
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+    if context.get_start_method() == 'forkserver': context.set_forkserver_preload(['charts']) # Not __main__, which would import the whole app
+    return context
+
+def get_chart_pool(broken=None):
+    # Only the caller holding the broken instance replaces it, so concurrent rebuilds can't cancel a fresh pool's work
+    global _chart_pool
+    with _chart_pool_lock:
+        if broken is not None and _chart_pool is broken: broken.shutdown(wait=False, cancel_futures=True); _chart_pool = None
+        if _chart_pool is None: _chart_pool = ProcessPoolExecutor(max_workers=1, mp_context=chart_pool_context())
+        return _chart_pool
+
+def _reset_chart_pool():
+    global _chart_pool, _chart_pool_lock
+    _chart_pool = None; _chart_pool_lock = threading.Lock() # A forked child can't use the parent's pool threads
+
+def failed_future(error):
+    future = Future(); future.set_exception(error); return future
+
+def submit_technical_chart(price_df):
+    # Never raises: any failure comes back as a failed future, which create_pdf turns into the fallback paragraph
+    if price_df is None: return failed_future(ValueError("Price history not available"))
+    try:
+        # Ship plain numpy arrays rather than the DataFrame to keep the pickle to the worker small
+        columns = {column: price_df[column].to_numpy().ravel() for column in CHART_COLUMNS}
+        args = (price_df.index.to_numpy(), columns)
+        pool = get_chart_pool()
+        try: return pool.submit(render_technical_chart, *args)
+        except BrokenProcessPool: return get_chart_pool(broken=pool).submit(render_technical_chart, *args) # A worker died; start a fresh pool
+    except Exception as e:
+        return failed_future(e)
 
 class ReportPDF:
-    def __init__(self, filepath, fundamentals):
-        self.doc = SimpleDocTemplate(filepath, pagesize=A4, rightMargin=inch*0.5, leftMargin=inch*0.5, topMargin=inch*0.5, bottomMargin=inch*0.5)
+    def __init__(self, fundamentals):
+        self.buffer = BytesIO()
+        self.doc = SimpleDocTemplate(self.buffer, pagesize=A4, rightMargin=inch*0.5, leftMargin=inch*0.5, topMargin=inch*0.5, bottomMargin=inch*0.5)
         self.styles = getSampleStyleSheet(); self.styles.add(ParagraphStyle(name='Justify', alignment=TA_JUSTIFY, leading=14))
         self.story = []; self.fundamentals = fundamentals
         self.navy_blue_header_style = TableStyle([('BACKGROUND', (0,0), (-1,0), colors.HexColor('#000080')), ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),('ALIGN', (0,0), (-1,-1), 'CENTER'), ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'), ('BOTTOMPADDING', (0,0), (-1,0), 12),('BACKGROUND', (0,1), (-1,-1), colors.HexColor("#f0f0f0")), ('GRID', (0,0), (-1,-1), 1, colors.black)])
@@ -179,9 +293,8 @@ class ReportPDF:
         canvas.rect(doc.leftMargin, doc.bottomMargin, doc.width, doc.height)
         canvas.restoreState()
 
-    def create_pdf(self, price_df, news, peer_df, tech_analysis, recommendation, key_highlights):
-        self.story.append(Spacer(1, 2*inch)); logo_image = self.fundamentals.get('logo_image')
-        if logo_image: logo_image.drawWidth = 1.5*inch; logo_image.drawHeight = 1.5*inch; self.story.append(logo_image)
+    def create_pdf(self, chart_future, news, peer_df, tech_analysis, recommendation, key_highlights):
+        self.story.append(Spacer(1, 2*inch))
         self.story.append(Spacer(1, 0.25*inch)); self.story.append(Paragraph("Saketh Equity Research", self.styles['Title']))
         self.story.append(Spacer(1, 0.5*inch)); self.story.append(Paragraph(f"Professional Equity Report For:", ParagraphStyle(name='sub', parent=self.styles['h2'], alignment=TA_CENTER)))
         self.story.append(Paragraph(self.fundamentals.get('Company Name', ''), ParagraphStyle(name='main', parent=self.styles['h1'], alignment=TA_CENTER)))
@@ -207,9 +320,11 @@ class ReportPDF:
         if financials is not None and not financials.empty and balance_sheet is not None and not balance_sheet.empty:
             fin_data = [['Metric', financials.columns[0].strftime('%Y'), financials.columns[1].strftime('%Y'), financials.columns[2].strftime('%Y')]]
             fin_items = ['Total Revenue', 'Net Income', 'Total Assets', 'Total Liabilities Net Minority Interest']
-            all_fins = pd.concat([financials, balance_sheet]);
             for item in fin_items:
-                if item in all_fins.index: row = [item] + [f"{val/1e7:,.0f}" for val in all_fins.loc[item].iloc[:3]]; fin_data.append(row)
+                # Look each metric up in its own statement rather than concatenating both frames
+                source = financials if item in financials.index else balance_sheet if item in balance_sheet.index else None
+                # Align on the header's dates, as the old concat did, so balance-sheet rows can't shift under the wrong year
+                if source is not None: row = [item] + [f"{val:,.0f}" if pd.notna(val) else 'N/A' for val in source.loc[item].reindex(financials.columns[:3]).to_numpy() / 1e7]; fin_data.append(row)
             self.story.append(Table(fin_data, style=self.navy_blue_header_style))
         else: self.story.append(Paragraph("Annual financial data not available.", self.styles['Normal']))
         self.story.append(Spacer(1, 12)); self.story.append(Paragraph("Quarterly Performance (in ₹ Cr)", self.styles['h3']))
@@ -224,21 +339,12 @@ class ReportPDF:
         self.story.append(PageBreak()); self.story.append(Paragraph("Technical Charts & Analysis", self.styles['h3']))
         tech_summary = Paragraph("<br/>".join([f"• {item}" for item in tech_analysis]), self.styles['Normal'])
         try:
-            fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(7, 8), gridspec_kw={'height_ratios': [2, 1, 1]})
-            ax1.plot(price_df.index, price_df['Close'], label='Close', color='blue'); ax1.plot(price_df.index, price_df['sma_50'], label='50-SMA', linestyle='--'); ax1.plot(price_df.index, price_df['sma_200'], label='200-SMA', linestyle='--')
-            ax1.fill_between(price_df.index, price_df['bb_upper'], price_df['bb_lower'], color='gray', alpha=0.1)
-            ax1.set_ylabel('Price (₹)'); ax1.legend(); ax1.grid(True)
-            ax2.plot(price_df.index, price_df['macd_line'], label='MACD'); ax2.plot(price_df.index, price_df['macd_signal'], label='Signal', linestyle='--')
-            ax2.bar(price_df.index, price_df['macd_hist'], color='gray', alpha=0.5)
-            ax2.set_ylabel('MACD'); ax2.legend(); ax2.grid(True)
-            ax3.plot(price_df.index, price_df['rsi'], label='RSI', color='purple'); ax3.axhline(70, color='r', linestyle='--'); ax3.axhline(30, color='g', linestyle='--')
-            ax3.set_ylabel('RSI'); ax3.legend(); ax3.grid(True)
-            for ax in [ax1, ax2, ax3]: plt.setp(ax.get_xticklabels(), rotation=20, ha='right')
-            plt.tight_layout()
-            img_buffer = BytesIO(); fig.savefig(img_buffer, format='png', dpi=300); plt.close(fig)
+            img_buffer = BytesIO(chart_future.result(timeout=CHART_TIMEOUT_SECONDS))
             chart_image = Image(img_buffer, width=4*inch, height=4.5*inch)
             t_data = [[chart_image, tech_summary]]
             self.story.append(Table(t_data, colWidths=[4.2*inch, 2.3*inch], style=[('VALIGN', (0,0), (-1,-1), 'TOP')]))
+        except FutureTimeoutError:
+            self.story.append(Paragraph(f"<b>Could not generate charts: rendering timed out after {CHART_TIMEOUT_SECONDS} seconds.</b>", self.styles['Normal']))
         except Exception as e:
             self.story.append(Paragraph(f"<b>Could not generate charts due to a technical error: {e}</b>", self.styles['Normal']))
         self.story.append(Spacer(1, 12)); self.story.append(Paragraph("Peer Comparison", self.styles['h3']))
@@ -256,50 +362,86 @@ class ReportPDF:
         self.story.append(Paragraph(disclaimer_text, self.styles['Justify']))
     def generate(self):
         self.doc.build(self.story, onFirstPage=self.draw_border, onLaterPages=self.draw_border)
+        return self.buffer.getvalue()
 
 # --- Main Workflow and Flask Routes ---
 def create_report(stock_ticker):
     symbol = stock_ticker
-    fundamentals = fetch_company_info(symbol) # Raises ValueError on failure
-    price_df = fetch_price(symbol)
-    price_df_tech = compute_technical_indicators(price_df)
-    tech_analysis = interpret_technical(price_df_tech)
-    recommendation = generate_recommendation(fundamentals, tech_analysis)
-    key_highlights = generate_key_highlights(fundamentals, tech_analysis)
     peers = PEER_MAPPING.get(symbol, [])
-    peer_df = get_peer_comparison(peers)
-    news = fetch_news_yfinance(symbol)
+    ticker = yf.Ticker(symbol, session=session) # Shared by the fundamentals and news fetches
+    # The four data sources are independent network calls, so dispatch them together
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        fundamentals_future = executor.submit(fetch_company_info, ticker)
+        price_future = executor.submit(fetch_price, symbol)
+        news_future = executor.submit(fetch_news_yfinance, ticker, limit=5)
+        peers_future = executor.submit(get_peer_comparison, peers)
+        price_df_tech = compute_technical_indicators(price_future.result(), symbol)
+        chart_future = submit_technical_chart(price_df_tech)
+        fundamentals = fundamentals_future.result() # Raises ValueError on failure
+        peer_df = peers_future.result()
+        news = news_future.result()
+    tech_analysis, tech_flags = interpret_technical(price_df_tech)
+    recommendation = generate_recommendation(fundamentals, tech_flags)
+    key_highlights = generate_key_highlights(fundamentals, tech_flags)
 
     filename = f"{symbol.replace('.', '_')}_Pro_Report_{datetime.now().strftime('%Y%m%d')}.pdf"
-    filepath = os.path.join(OUTPUT_FOLDER, filename)
-    
-    pdf = ReportPDF(filepath, fundamentals)
-    pdf.create_pdf(price_df_tech, news, peer_df, tech_analysis, recommendation, key_highlights)
-    
-    return filename
+    pdf = ReportPDF(fundamentals)
+    pdf.create_pdf(chart_future, news, peer_df, tech_analysis, recommendation, key_highlights)
+    return store_report(pdf.generate()), filename
+
+def prune_reports(now):
+    # Runs at most once a minute per worker, so /generate doesn't stat the whole folder every time
+    global _last_prune
+    if now - _last_prune < 60: return
+    _last_prune = now
+    for entry in os.scandir(REPORT_FOLDER):
+        try:
+            if entry.stat().st_mtime + REPORT_TTL_SECONDS < now: os.remove(entry.path)
+        except OSError: continue # Already removed by another worker
+
+def report_path(token): return os.path.join(REPORT_FOLDER, f"{token}.pdf")
+
+def store_report(data):
+    token = uuid.uuid4().hex
+    prune_reports(time.time())
+    filepath = report_path(token); temp_path = filepath + '.tmp'
+    with open(temp_path, 'wb') as f: f.write(data)
+    os.replace(temp_path, filepath) # Atomic, so other workers never see a partial PDF
+    return token
 
 @app.route('/')
 def index(): return render_template('index.html')
 
 @app.route('/api/stocks')
-def get_stocks(): return jsonify(SECTOR_STOCK_MAPPING)
+def get_stocks(): return Response(_STOCKS_JSON, mimetype='application/json')
 
 @app.route('/generate', methods=['POST'])
 def generate():
     try:
         stock_ticker = request.form['stock_select']
         if not stock_ticker: return jsonify({'error': 'No stock selected.'}), 400
-        pdf_filename = create_report(stock_ticker)
-        return jsonify({'download_url': f"/download/{pdf_filename}"})
+        report_token, filename = create_report(stock_ticker)
+        return jsonify({'download_url': url_for('download_file', token=report_token, filename=filename)})
     except ValueError as e:
         return jsonify({'error': f"The data source is currently busy or unavailable for {stock_ticker}. This can happen with free APIs. Please wait 30 seconds and try again."}), 400
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return jsonify({'error': 'An internal server error occurred. Please check the logs.'}), 500
 
-@app.route('/download/<filename>')
-def download_file(filename):
-    return send_from_directory(OUTPUT_FOLDER, filename, as_attachment=True)
+@app.route('/download/<token>/<filename>')
+def download_file(token, filename):
+    if not re.fullmatch(r'[0-9a-f]{32}', token): abort(404)
+    filepath = report_path(token)
+    try:
+        if os.path.getmtime(filepath) + REPORT_TTL_SECONDS < time.time(): abort(404)
+    except OSError: abort(404)
+    return send_file(filepath, mimetype='application/pdf', as_attachment=True, download_name=filename)
+
+# Start the chart worker at import so a worker's first report doesn't pay the process cold start.
+# Skipped inside pool children, which re-import the main module as __mp_main__ before parent_process() is set.
+if __name__ != '__mp_main__' and multiprocessing.parent_process() is None:
+    if hasattr(os, 'register_at_fork'): os.register_at_fork(after_in_child=_reset_chart_pool)
+    get_chart_pool().submit(charts.warm_up)
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,27 @@
+# Chart rendering for the report's technical section. Kept free of Flask/yfinance/reportlab/numba imports so
+# chart pool workers only load numpy and matplotlib.
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from io import BytesIO
+
+CHART_COLUMNS = ['Close', 'sma_50', 'sma_200', 'bb_upper', 'bb_lower', 'macd_line', 'macd_signal', 'macd_hist', 'rsi']
+
+def warm_up():
+    # Submitted once at startup so the pool's worker process exists before the first report
+    return None
+
+def render_technical_chart(dates, columns):
+    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(7, 8), gridspec_kw={'height_ratios': [2, 1, 1]})
+    ax1.plot(dates, columns['Close'], label='Close', color='blue'); ax1.plot(dates, columns['sma_50'], label='50-SMA', linestyle='--'); ax1.plot(dates, columns['sma_200'], label='200-SMA', linestyle='--')
+    ax1.fill_between(dates, columns['bb_upper'], columns['bb_lower'], color='gray', alpha=0.1)
+    ax1.set_ylabel('Price (₹)'); ax1.legend(); ax1.grid(True)
+    ax2.plot(dates, columns['macd_line'], label='MACD'); ax2.plot(dates, columns['macd_signal'], label='Signal', linestyle='--')
+    ax2.bar(dates, columns['macd_hist'], color='gray', alpha=0.5)
+    ax2.set_ylabel('MACD'); ax2.legend(); ax2.grid(True)
+    ax3.plot(dates, columns['rsi'], label='RSI', color='purple'); ax3.axhline(70, color='r', linestyle='--'); ax3.axhline(30, color='g', linestyle='--')
+    ax3.set_ylabel('RSI'); ax3.legend(); ax3.grid(True)
+    for ax in [ax1, ax2, ax3]: plt.setp(ax.get_xticklabels(), rotation=20, ha='right')
+    plt.tight_layout()
+    img_buffer = BytesIO(); fig.savefig(img_buffer, format='png', dpi=150); plt.close(fig) # 150 DPI is still ~2x the 4in print size
+    return img_buffer.getvalue()